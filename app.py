@@ -1,12 +1,12 @@
 # file: app.py
 import tkinter as tk
-from tkinter import messagebox, ttk, filedialog
+from tkinter import messagebox, ttk
 
 from constants import BLOOD_TYPES, POPULATION_PERCENT
 from db import DB
 from service import Service
 from style import apply_theme
-from export import to_csv, to_json
+# filedialog / export נטענים רק בלחיצה על ייצוא — לא בזמן עליית החלון
 
 class App(ttk.Frame):
     def __init__(self, master, service: Service, theme_mode: str = "dark"):
@@ -42,11 +42,26 @@ class App(ttk.Frame):
         nb.add(self.tab_stock, text="מצב מלאי")
         nb.add(self.tab_export, text="ייצוא ודוחות")
 
-        self._build_intake_tab()
-        self._build_routine_tab()
-        self._build_emergency_tab()
-        self._build_stock_tab()
-        self._build_export_tab()
+        # בנייה עצלה: כל לשונית נבנית בפעם הראשונה שהיא נבחרת
+        self.nb = nb
+        self._tab_builders = {
+            str(self.tab_intake): self._build_intake_tab,
+            str(self.tab_routine): self._build_routine_tab,
+            str(self.tab_emergency): self._build_emergency_tab,
+            str(self.tab_stock): self._build_stock_tab,
+            str(self.tab_export): self._build_export_tab,
+        }
+        self._built_tabs = set()
+        nb.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+        self._ensure_tab_built(nb.select())
+
+    def _on_tab_changed(self, _event=None):
+        self._ensure_tab_built(self.nb.select())
+
+    def _ensure_tab_built(self, tab_id: str):
+        if tab_id and tab_id not in self._built_tabs:
+            self._built_tabs.add(tab_id)
+            self._tab_builders[tab_id]()
 
     # ---------- Intake ----------
     def _build_intake_tab(self):
@@ -202,29 +217,47 @@ class App(ttk.Frame):
         self.lbl_on = ttk.Label(box, text="")
         self.lbl_on.grid(row=0, column=0, sticky="w", padx=8, pady=8)
 
-        ttk.Button(box, text="נפק את כל מלאי O-", style="Danger.TButton", command=self._on_emergency)\
-            .grid(row=0, column=1, sticky="e", padx=8, pady=8)
+        ttk.Label(box, text="כמות מנות (ריק = הכל):").grid(row=0, column=1, sticky="e", padx=6, pady=8)
+        self.e_em_qty = ttk.Entry(box, width=10)
+        self.e_em_qty.grid(row=0, column=2, sticky="w", padx=6, pady=8)
+
+        ttk.Button(box, text="נפק O- לחירום", style="Danger.TButton", command=self._on_emergency)\
+            .grid(row=0, column=3, sticky="e", padx=8, pady=8)
 
         info = ttk.Labelframe(self.tab_emergency, text="למה O-?", style="Card.TLabelframe")
         info.pack(fill="x", pady=(10, 0))
         ttk.Label(info, text="O- הוא התורם האוניברסלי — מתאים לכל סוגי הדם. במצב אר\"ן אין זמן לבדיקות תאימות, ולכן מנפיקים O- בלבד.",
                   wraplength=900).pack(anchor="w", padx=8, pady=8)
 
-        self._update_on_label()
+        self.lbl_on.config(text="טוען מלאי O-...")
+        self.after_idle(self._update_on_label)
 
     def _update_on_label(self):
-        count = service.db.count_available('O-')
+        count = self.service.db.count_available('O-')
         self.lbl_on.config(text=f"מלאי O- זמין: {count} מנות")
 
     def _on_emergency(self):
-        count = service.db.count_available('O-')
+        raw = self.e_em_qty.get().strip()
+        qty = None
+        if raw:
+            try:
+                qty = int(raw)
+            except Exception:
+                qty = 0
+            if qty <= 0:
+                messagebox.showerror("שגיאה", "כמות מנות חייבת להיות מספר חיובי")
+                return
+        count = self.service.db.count_available('O-')
         if count <= 0:
             messagebox.showerror("אין מלאי", "אין מלאי O- זמין לניפוק חירום")
             self._update_on_label()
             return
-        if messagebox.askyesno("אישור חירום", f"האם לנפק את כל {count} מנות ה-O-?"):
-            taken = self.service.emergency_issue_all_on()
+        question = f"האם לנפק את כל {count} מנות ה-O-?" if qty is None \
+            else f"האם לנפק {min(qty, count)} מנות O- (זמין: {count})?"
+        if messagebox.askyesno("אישור חירום", question):
+            taken = self.service.emergency_issue(qty)
             messagebox.showinfo("בוצע", f"נופקו {taken} מנות O- לחירום")
+            self.e_em_qty.delete(0, tk.END)
             self._refresh_stock()
             self._update_on_label()
 
@@ -252,17 +285,48 @@ class App(ttk.Frame):
         self.tree_stock.tag_configure("ok", foreground="#2e7d32")
 
         self.tree_stock.pack(fill="both", expand=True, pady=8)
-        self._refresh_stock()
+
+        # לוח What-if: כמה ניתן לספק לכל סוג מקבל (לקריאה בלבד, ללא audit)
+        whatif = ttk.Labelframe(frame, text="יכולת אספקה מקסימלית לפי סוג מקבל", style="Card.TLabelframe")
+        whatif.pack(fill="both", expand=True)
+
+        cols = ("recipient", "max", "plan")
+        self.tree_matrix = ttk.Treeview(whatif, columns=cols, show="headings", height=8)
+        self.tree_matrix.heading("recipient", text="סוג מקבל")
+        self.tree_matrix.heading("max", text="מקסימום מנות")
+        self.tree_matrix.heading("plan", text="תכנית (תורם:כמות)")
+        self.tree_matrix.column("recipient", width=120, anchor="center")
+        self.tree_matrix.column("max", width=140, anchor="center")
+        self.tree_matrix.column("plan", width=560, anchor="w")
+        self.tree_matrix.tag_configure("empty", foreground="#b71c1c")
+        self.tree_matrix.tag_configure("low", foreground="#e67e22")
+        self.tree_matrix.tag_configure("ok", foreground="#2e7d32")
+        self.tree_matrix.pack(fill="both", expand=True, pady=8)
+
+        # הלשונית מוצגת מיד; צילום המלאי נטען אחרי שהמסגרת צוירה
+        self.after_idle(self._refresh_stock)
 
     def _refresh_stock(self):
+        if str(self.tab_stock) not in self._built_tabs:
+            return  # הלשונית עוד לא נבנתה — תיטען בפתיחה הראשונה
+        matrix = self.service.fulfillment_matrix()
         for i in self.tree_stock.get_children():
             self.tree_stock.delete(i)
         for bt in BLOOD_TYPES:
-            cnt = service.db.count_available(bt)
+            cnt = matrix["stock"][bt]
             pop = POPULATION_PERCENT[bt]
             tag = "ok" if cnt >= 10 else ("low" if cnt > 0 else "empty")
             self.tree_stock.insert("", "end", values=(bt, cnt, f"{pop}%"), tags=(tag,))
 
+        for i in self.tree_matrix.get_children():
+            self.tree_matrix.delete(i)
+        for bt in BLOOD_TYPES:
+            row = matrix["recipients"][bt]
+            max_qty = row["max_qty"]
+            plan_txt = "  ".join(f"{p['donor']}:{p['take']}" for p in row["plan"] if p["take"] > 0) or "—"
+            tag = "ok" if max_qty >= 10 else ("low" if max_qty > 0 else "empty")
+            self.tree_matrix.insert("", "end", values=(bt, max_qty, plan_txt), tags=(tag,))
+
     # ---------- Export ----------
     def _build_export_tab(self):
         wrap = ttk.Labelframe(self.tab_export, text="ייצוא נתונים (Copies of Records)", style="Card.TLabelframe")
@@ -282,6 +346,15 @@ class App(ttk.Frame):
         ttk.Button(wrap, text="Export Audit Log (JSON)", command=self._export_audit_json)\
             .grid(row=1, column=2, padx=8, pady=8, sticky="w")
 
+        delta = ttk.Labelframe(self.tab_export, text="ייצוא מצטבר (רק שורות חדשות/שהשתנו)", style="Card.TLabelframe")
+        delta.pack(fill="x", pady=(10, 0))
+        ttk.Button(delta, text="Incremental Export (CSV)", style="Accent.TButton",
+                   command=lambda: self._export_delta("csv")).grid(row=0, column=0, padx=8, pady=8, sticky="w")
+        ttk.Button(delta, text="Incremental Export (NDJSON)",
+                   command=lambda: self._export_delta("ndjson")).grid(row=0, column=1, padx=8, pady=8, sticky="w")
+        ttk.Label(delta, text="ה-watermark נשמר ב-manifest.json בתיקיית היעד. להרצה מ-cron: python export.py --out DIR",
+                  wraplength=900).grid(row=1, column=0, columnspan=3, padx=8, pady=(0, 8), sticky="w")
+
         info = ttk.Label(self.tab_export,
                          text="ייצוא לפורמטים נפוצים (CSV/JSON) עומד בדרישת Copies of Records של Part 11.",
                          wraplength=900)
@@ -289,7 +362,9 @@ class App(ttk.Frame):
 
     # --- export handlers ---
     def _export_donations_csv(self):
-        rows = service.db.export_donations()
+        from tkinter import filedialog
+        from export import to_csv
+        rows = self.service.db.export_donations()
         path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")],
                                             initialfile="donations.csv")
         if path:
@@ -297,7 +372,9 @@ class App(ttk.Frame):
             messagebox.showinfo("Export", f"Donations exported to:\n{path}")
 
     def _export_dispensations_csv(self):
-        rows = service.db.export_dispensations()
+        from tkinter import filedialog
+        from export import to_csv
+        rows = self.service.db.export_dispensations()
         path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")],
                                             initialfile="dispensations.csv")
         if path:
@@ -305,7 +382,9 @@ class App(ttk.Frame):
             messagebox.showinfo("Export", f"Dispensations exported to:\n{path}")
 
     def _export_audit_csv(self):
-        rows = service.db.export_audit()
+        from tkinter import filedialog
+        from export import to_csv
+        rows = self.service.db.export_audit()
         path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")],
                                             initialfile="audit_log.csv")
         if path:
@@ -313,7 +392,9 @@ class App(ttk.Frame):
             messagebox.showinfo("Export", f"Audit log exported to:\n{path}")
 
     def _export_donations_json(self):
-        rows = service.db.export_donations()
+        from tkinter import filedialog
+        from export import to_json
+        rows = self.service.db.export_donations()
         path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")],
                                             initialfile="donations.json")
         if path:
@@ -321,7 +402,9 @@ class App(ttk.Frame):
             messagebox.showinfo("Export", f"Donations exported to:\n{path}")
 
     def _export_dispensations_json(self):
-        rows = service.db.export_dispensations()
+        from tkinter import filedialog
+        from export import to_json
+        rows = self.service.db.export_dispensations()
         path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")],
                                             initialfile="dispensations.json")
         if path:
@@ -329,13 +412,24 @@ class App(ttk.Frame):
             messagebox.showinfo("Export", f"Dispensations exported to:\n{path}")
 
     def _export_audit_json(self):
-        rows = service.db.export_audit()
+        from tkinter import filedialog
+        from export import to_json
+        rows = self.service.db.export_audit()
         path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")],
                                             initialfile="audit_log.json")
         if path:
             to_json(path, rows)
             messagebox.showinfo("Export", f"Audit log exported to:\n{path}")
 
+    def _export_delta(self, fmt: str):
+        from tkinter import filedialog
+        from export import export_delta
+        out_dir = filedialog.askdirectory(title="תיקיית יעד לייצוא מצטבר")
+        if out_dir:
+            written = export_delta(self.service.db, out_dir, fmt=fmt)
+            summary = "\n".join(f"{t}: {n} rows" for t, n in written.items())
+            messagebox.showinfo("Export", f"Incremental export to:\n{out_dir}\n\n{summary}")
+
 if __name__ == "__main__":
     db = DB()
     service = Service(db)
@@ -0,0 +1,76 @@
+# file: bench_emergency.py
+# SLO לניפוק חירום: p99 של תפיסת מנות O- מתחת לסף (ms) כשיש 1M מנות זמינות.
+# הרצה: python bench_emergency.py [--units 1000000] [--iters 2000] [--slo-ms 5]
+#        python bench_emergency.py --qty all      # ניפוק כל המלאי בקריאה אחת (זמן כולל)
+import argparse, os, sys, tempfile, time
+from db import DB
+from service import Service
+from constants import iso_now, percentile
+
+def _seed(db: DB, units: int):
+    ts = iso_now()
+    rows = (("000000000", "bench", "O-", ts) for _ in range(units))
+    with db.conn:
+        db.conn.executemany("""
+            INSERT INTO donations(donor_id, donor_name, blood_type, donation_date, status)
+            VALUES (?,?,?,?, 'available');
+        """, rows)
+
+def _bench_all(units: int) -> int:
+    # מסלול "כל המלאי": טרנזקציה אחת שמעדכנת units שורות (כולל trigger ה-change feed לכל שורה)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DB(os.path.join(tmp, "bench.db"))
+        svc = Service(db, actor="bench")
+        _seed(db, units)
+        t0 = time.perf_counter()
+        taken = svc.emergency_issue(None)
+        elapsed = time.perf_counter() - t0
+        remaining = db.count_available('O-')
+        db.close()
+
+    print(f"units={units} qty=all taken={taken} elapsed={elapsed:.3f}s remaining={remaining}")
+    if taken != units or remaining != 0:
+        print("FAIL: stock mismatch")
+        return 1
+    print("OK")
+    return 0
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Emergency O- issue latency SLO")
+    ap.add_argument("--units", type=int, default=1_000_000)
+    ap.add_argument("--iters", type=int, default=2000)
+    ap.add_argument("--qty", default="2", help="מנות לכל ניפוק, או all לניפוק כל המלאי")
+    ap.add_argument("--slo-ms", type=float, default=5.0)
+    args = ap.parse_args(argv)
+    if args.qty == "all":
+        return _bench_all(args.units)
+    args.qty = int(args.qty)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DB(os.path.join(tmp, "bench.db"))
+        svc = Service(db, actor="bench")
+        _seed(db, args.units)
+
+        lat = []
+        for _ in range(args.iters):
+            t0 = time.perf_counter()
+            taken = svc.emergency_issue(args.qty)
+            lat.append((time.perf_counter() - t0) * 1000.0)
+            assert taken == args.qty, taken
+        remaining = db.count_available('O-')
+        db.close()
+
+    p50, p99 = percentile(lat, 50), percentile(lat, 99)
+    print(f"units={args.units} iters={args.iters} qty={args.qty} "
+          f"p50={p50:.3f}ms p99={p99:.3f}ms max={max(lat):.3f}ms remaining={remaining}")
+    if remaining != args.units - args.iters * args.qty:
+        print("FAIL: stock mismatch")
+        return 1
+    if p99 >= args.slo_ms:
+        print(f"FAIL: p99 {p99:.3f}ms >= SLO {args.slo_ms}ms")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
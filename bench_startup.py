@@ -0,0 +1,85 @@
+# file: bench_startup.py
+# זמן עלייה של app.py: time-to-first-frame (החלון צויר) ו-time-to-interactive
+# (כל טעינות ה-after_idle הראשונות הסתיימו ולולאת האירועים מגיבה).
+# דורש תצוגה (DISPLAY / Xvfb). הרצה: python bench_startup.py [--units 200000] [--runs 5]
+import argparse, os, subprocess, sys, tempfile, json
+from constants import percentile
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import tkinter as tk
+from app import App
+from db import DB
+from service import Service
+t_import = time.perf_counter()
+
+marks = {}
+root = tk.Tk()
+db = DB(sys.argv[1])
+app = App(root, Service(db), theme_mode="dark")
+
+def first_frame(_event=None):
+    if "first_frame" not in marks:
+        marks["first_frame"] = time.perf_counter()
+        # after_idle רץ לפי סדר — ה-probe ירוץ אחרי הטעינות שה-App תזמן
+        root.after_idle(lambda: root.after(0, interactive))
+
+def interactive():
+    marks["interactive"] = time.perf_counter()
+    # פתיחה ראשונה של לשונית המלאי (בנייה + צילום מלאי)
+    t = time.perf_counter()
+    app.nb.select(app.tab_stock)
+    root.update()
+    marks["stock_tab"] = time.perf_counter() - t
+    root.destroy()
+
+root.bind("<Map>", first_frame, add="+")
+root.mainloop()
+db.close()
+print(json.dumps({
+    "import_ms": (t_import - t0) * 1000.0,
+    "first_frame_ms": (marks["first_frame"] - t0) * 1000.0,
+    "interactive_ms": (marks["interactive"] - t0) * 1000.0,
+    "stock_tab_ms": marks["stock_tab"] * 1000.0,
+}))
+"""
+
+def _seed(path: str, units: int):
+    from db import DB
+    from constants import BLOOD_TYPES, iso_now
+    db = DB(path)
+    ts = iso_now()
+    rows = (("000000000", "bench", BLOOD_TYPES[i % len(BLOOD_TYPES)], ts) for i in range(units))
+    with db.conn:
+        db.conn.executemany("""
+            INSERT INTO donations(donor_id, donor_name, blood_type, donation_date, status)
+            VALUES (?,?,?,?, 'available');
+        """, rows)
+    db.close()
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="BECS startup time (time-to-first-frame / time-to-interactive)")
+    ap.add_argument("--units", type=int, default=200_000)
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        _seed(path, args.units)
+        samples = []
+        for _ in range(args.runs):
+            # תהליך חדש בכל ריצה — מודד גם את זמן ה-import (cold-ish start)
+            out = subprocess.run([sys.executable, "-c", _CHILD, path], cwd=here,
+                                 capture_output=True, text=True, check=True)
+            samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"units={args.units} runs={args.runs}")
+    for key in ("import_ms", "first_frame_ms", "interactive_ms", "stock_tab_ms"):
+        vals = [s[key] for s in samples]
+        print(f"{key:<16} p50={percentile(vals, 50):8.1f}ms  max={max(vals):8.1f}ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -32,3 +32,11 @@ def parse_ddmmyyyy_or_iso(s: str) -> str:
         return d.strftime("%Y-%m-%d 00:00:00")
     except Exception:
         return iso_now()
+
+def percentile(values: list[float], p: float) -> float:
+    """אחוזון (nearest-rank) — לדוחות ביצועים."""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(p / 100.0 * len(s))) - 1))
+    return s[k]
@@ -1,13 +1,38 @@
 # file: db.py
 import sqlite3
+from typing import Callable
 from constants import BLOOD_TYPES, iso_now
 
+# יש להעלות בכל שינוי ב-_init_schema כדי שה-DDL ירוץ שוב על DB קיימים
+SCHEMA_VERSION = 2
+
+# משפט מוכן אחד לתפיסת מנות: בחירה לפי האינדקס (blood_type, status) ועדכון באותו statement
+_CLAIM_SQL = """
+    UPDATE donations SET status=?
+    WHERE id IN (
+        SELECT id FROM donations
+        WHERE blood_type=? AND status='available'
+        ORDER BY id
+        LIMIT ?
+    );
+"""
+_LOG_DISPENSATION_SQL = """
+    INSERT INTO dispensations(blood_type, quantity, dispensation_date, mode)
+    VALUES (?,?,?,?);
+"""
+_ADD_AUDIT_SQL = """
+    INSERT INTO audit_log(ts, actor, action, entity, entity_id, details_json)
+    VALUES (?,?,?,?,?,?);
+"""
+
 class DB:
     def __init__(self, path: str = "blood_bank.db"):
         # חשוב לשמור על same thread כדי לעבוד עם Tk
         self.conn = sqlite3.connect(path)
         self.conn.execute("PRAGMA foreign_keys = ON;")
-        self._init_schema()
+        # DB שכבר מאותחל לגרסת הסכמה הנוכחית — מדלגים על ה-DDL (עלייה מהירה)
+        if self.conn.execute("PRAGMA user_version;").fetchone()[0] != SCHEMA_VERSION:
+            self._init_schema()
 
     def _init_schema(self):
         cur = self.conn.cursor()
@@ -61,6 +86,41 @@ class DB:
             SELECT RAISE(ABORT,'audit log is immutable');
         END;
         """)
+
+        # --- change feed for donations (for delta exports) ---
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS donation_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            donation_id INTEGER NOT NULL,
+            ts TEXT NOT NULL
+        );
+        """)
+        # בלי אינדקס על donation_id: הוא גרם ל-SCAN של כל ההיסטוריה במקום seek על seq > watermark,
+        # והאט כל UPDATE של status (גרסת סכמה 1 יצרה אותו)
+        cur.execute("DROP INDEX IF EXISTS idx_donation_changes_donation;")
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_donations_change_ins
+        AFTER INSERT ON donations
+        BEGIN
+            INSERT INTO donation_changes(donation_id, ts) VALUES (NEW.id, datetime('now','localtime'));
+        END;
+        """)
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_donations_change_status
+        AFTER UPDATE OF status ON donations
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            INSERT INTO donation_changes(donation_id, ts) VALUES (NEW.id, datetime('now','localtime'));
+        END;
+        """)
+        # DB קיים מלפני ה-change feed: כל התרומות נחשבות "שינוי" פעם אחת
+        cur.execute("""
+        INSERT INTO donation_changes(donation_id, ts)
+        SELECT id, donation_date FROM donations
+        WHERE NOT EXISTS (SELECT 1 FROM donation_changes)
+        ORDER BY id;
+        """)
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
         self.conn.commit()
 
     # ---- Donations CRUD ----
@@ -78,6 +138,19 @@ class DB:
         cur.execute("SELECT COUNT(*) FROM donations WHERE blood_type=? AND status='available';", (blood_type,))
         return cur.fetchone()[0]
 
+    def count_available_by_type(self) -> dict[str, int]:
+        """צילום מלאי בשאילתה אחת: {blood_type: available_count} לכל 8 הסוגים."""
+        counts = {bt: 0 for bt in BLOOD_TYPES}
+        cur = self.conn.cursor()
+        cur.execute("SELECT blood_type, COUNT(*) FROM donations WHERE status='available' GROUP BY blood_type;")
+        for bt, n in cur.fetchall():
+            counts[bt] = n
+        return counts
+
+    def data_version(self) -> int:
+        # משתנה כאשר חיבור אחר כתב ל-DB (כתיבות של חיבור זה נספרות ב-Service)
+        return self.conn.execute("PRAGMA data_version;").fetchone()[0]
+
     def available_ids(self, blood_type: str, limit: int) -> list[int]:
         cur = self.conn.cursor()
         cur.execute("""
@@ -96,20 +169,31 @@ class DB:
         self.conn.commit()
         return len(ids)
 
+    def issue_units(self, blood_type: str, limit: int | None, mode: str,
+                    audit_row: Callable[[int], dict]) -> int:
+        """מסמן עד limit מנות (None = הכל) כמנופקות, רושם ניפוק ו-audit — הכל בטרנזקציה אחת.
+        audit_row(taken) מחזיר את שדות add_audit (התוכן נקבע ב-Service)."""
+        status = 'emergency_dispensed' if mode == 'emergency' else 'dispensed'
+        # LIMIT -1 ב-SQLite = ללא הגבלה; אין רשימת IN (?,?,...) ולכן אין חריגה ממגבלת המשתנים
+        lim = -1 if limit is None else int(limit)
+        with self.conn:
+            cur = self.conn.execute(_CLAIM_SQL, (status, blood_type, lim))
+            taken = cur.rowcount
+            if taken > 0:
+                self.conn.execute(_LOG_DISPENSATION_SQL, (blood_type, taken, iso_now(), mode))
+                row = audit_row(taken)
+                self.conn.execute(_ADD_AUDIT_SQL, (row["ts"], row["actor"], row["action"], row["entity"],
+                                                   row["entity_id"], row["details_json"]))
+        return taken
+
     # ---- Dispensation log (business) ----
     def log_dispensation(self, blood_type: str, qty: int, mode: str):
-        self.conn.execute("""
-            INSERT INTO dispensations(blood_type, quantity, dispensation_date, mode)
-            VALUES (?,?,?,?);
-        """, (blood_type, qty, iso_now(), mode))
+        self.conn.execute(_LOG_DISPENSATION_SQL, (blood_type, qty, iso_now(), mode))
         self.conn.commit()
 
     # ---- Audit Trail (DB API) ----
     def add_audit(self, ts: str, actor: str, action: str, entity: str, entity_id: str | None, details_json: str):
-        self.conn.execute("""
-            INSERT INTO audit_log(ts, actor, action, entity, entity_id, details_json)
-            VALUES (?,?,?,?,?,?);
-        """, (ts, actor, action, entity, entity_id, details_json))
+        self.conn.execute(_ADD_AUDIT_SQL, (ts, actor, action, entity, entity_id, details_json))
         self.conn.commit()
 
     # ---- Export helpers ----
@@ -128,5 +212,21 @@ class DB:
     def export_audit(self) -> list[dict]:
         return self.fetch_all("SELECT * FROM audit_log ORDER BY id;")
 
+    # ---- Delta export helpers (watermark = last exported id / change seq) ----
+    def export_donations_changed_since(self, seq: int) -> list[dict]:
+        # מצב נוכחי של כל תרומה שהשתנתה אחרי seq, עם ה-seq האחרון שלה
+        return self.fetch_all("""
+            SELECT d.*, c.change_seq FROM donations d
+            JOIN (SELECT donation_id, MAX(seq) AS change_seq FROM donation_changes
+                  WHERE seq > ? GROUP BY donation_id) c ON c.donation_id = d.id
+            ORDER BY c.change_seq;
+        """, (seq,))
+
+    def export_dispensations_since(self, last_id: int) -> list[dict]:
+        return self.fetch_all("SELECT * FROM dispensations WHERE id > ? ORDER BY id;", (last_id,))
+
+    def export_audit_since(self, last_id: int) -> list[dict]:
+        return self.fetch_all("SELECT * FROM audit_log WHERE id > ? ORDER BY id;", (last_id,))
+
     def close(self):
         self.conn.close()
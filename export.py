@@ -1,6 +1,8 @@
 # file: export.py
-import csv, json
+import csv, json, os, argparse
+from datetime import datetime
 from typing import List, Dict
+from constants import iso_now
 
 def to_csv(path: str, rows: List[Dict]):
     # אם אין נתונים – ניצור קובץ ריק עם כותרת מינימלית (או נשאיר ריק)
@@ -16,3 +18,120 @@ def to_csv(path: str, rows: List[Dict]):
 def to_json(path: str, rows: List[Dict]):
     with open(path, "w", encoding="utf-8") as f:
         json.dump(rows, f, ensure_ascii=False, indent=2)
+
+# ---------- Delta exports (append-only, watermark per target) ----------
+MANIFEST = "manifest.json"
+
+# target -> (DB method, watermark column)
+DELTA_TARGETS = {
+    "donations":     ("export_donations_changed_since", "change_seq"),
+    "dispensations": ("export_dispensations_since", "id"),
+    "audit_log":     ("export_audit_since", "id"),
+}
+
+def append_csv(path: str, rows: List[Dict]):
+    if not rows:
+        return
+    new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+        f.flush(); os.fsync(f.fileno())
+
+def append_ndjson(path: str, rows: List[Dict]):
+    if not rows:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        f.flush(); os.fsync(f.fileno())
+
+def load_manifest(out_dir: str) -> Dict:
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"targets": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_manifest(out_dir: str, manifest: Dict):
+    # כתיבה אטומית: קובץ זמני ואז replace
+    path = os.path.join(out_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _truncate(path: str, size: int):
+    if os.path.exists(path) and os.path.getsize(path) > size:
+        with open(path, "r+b") as f:
+            f.truncate(size)
+            f.flush(); os.fsync(f.fileno())
+
+def export_delta(db, out_dir: str, fmt: str = "csv", targets: List[str] | None = None) -> Dict[str, int]:
+    """מייצא רק שורות חדשות/שהשתנו מאז הריצה הקודמת ומוסיף אותן לקבצים מתגלגלים (יומיים).
+    ה-watermark נשמר ב-manifest.json בתיקיית היעד, בנפרד לכל (target, fmt). מחזיר {target: rows_written}.
+
+    הגנה מכפילויות: לפני כל append נרשם ב-manifest קובץ ה-pending וגודלו; אם הריצה נקטעה
+    לפני עדכון ה-watermark, הריצה הבאה חותכת את הקובץ חזרה לגודל הזה ורק אז כותבת שוב."""
+    if fmt not in ("csv", "ndjson"):
+        raise ValueError("fmt must be 'csv' or 'ndjson'")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    day = datetime.now().strftime("%Y-%m-%d")
+    written = {}
+    for target in (targets or list(DELTA_TARGETS)):
+        method, wm_col = DELTA_TARGETS[target]
+        key = f"{target}.{fmt}"
+        state = manifest["targets"].setdefault(key, {"target": target, "format": fmt,
+                                                     "watermark": 0, "files": {}})
+        pending = state.pop("pending", None)
+        if pending:
+            # ריצה קודמת נקטעה אחרי append ולפני עדכון ה-watermark
+            _truncate(os.path.join(out_dir, pending["file"]), pending["bytes"])
+            _save_manifest(out_dir, manifest)
+
+        rows = getattr(db, method)(state["watermark"])
+        written[target] = len(rows)
+        if not rows:
+            continue
+        fname = f"{target}-{day}.{fmt}"
+        path = os.path.join(out_dir, fname)
+        info = state["files"].setdefault(fname, {"rows": 0, "bytes": 0})
+        _truncate(path, info["bytes"])  # בתים שלא נרשמו ב-manifest אינם חלק מה-feed
+        state["pending"] = {"file": fname, "bytes": info["bytes"]}
+        _save_manifest(out_dir, manifest)
+
+        (append_csv if fmt == "csv" else append_ndjson)(path, rows)
+        # ה-watermark מתקדם רק אחרי שהשורות נכתבו לדיסק
+        state.pop("pending")
+        state["watermark"] = max(r[wm_col] for r in rows)
+        state["watermark_column"] = wm_col
+        info["rows"] += len(rows)
+        info["bytes"] = os.path.getsize(path)
+        state["last_run"] = iso_now()
+        _save_manifest(out_dir, manifest)
+    return written
+
+def main(argv=None) -> int:
+    """CLI ל-cron (ללא GUI): python export.py --out DIR [--db blood_bank.db] [--format csv|ndjson]"""
+    from db import DB
+    ap = argparse.ArgumentParser(description="BECS incremental export")
+    ap.add_argument("--db", default="blood_bank.db")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    ap.add_argument("--target", action="append", choices=list(DELTA_TARGETS))
+    args = ap.parse_args(argv)
+    db = DB(args.db)
+    try:
+        written = export_delta(db, args.out, fmt=args.format, targets=args.target)
+    finally:
+        db.close()
+    for target, n in written.items():
+        print(f"{target}: {n} rows")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
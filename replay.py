@@ -0,0 +1,239 @@
+# file: replay.py
+# הרצה חוזרת של עומס אמיתי מתוך ה-audit log מול DB זמני (scratch) דרך Service.
+# מקור: DB של production (טבלת audit_log) או קובץ ייצוא (CSV / JSON / NDJSON).
+#
+#   python replay.py blood_bank.db                      # מהר ככל האפשר, worker יחיד
+#   python replay.py audit_log.csv --speed 1            # בתזמון המקורי
+#   python replay.py blood_bank.db --workers 4 --json report.json
+import argparse, csv, json, os, queue, sqlite3, sys, tempfile, threading, time
+from datetime import datetime
+from typing import List, Dict
+
+from db import DB
+from service import Service
+from constants import percentile
+
+REPLAYED_ACTIONS = ("INTAKE", "PLAN_ROUTINE", "ISSUE_ROUTINE", "ISSUE_EMERGENCY")
+
+# ---------- Loading ----------
+def _load_from_db(path: str) -> List[Dict]:
+    # קריאה בלבד — לא פותחים דרך DB() כדי לא להריץ DDL על production
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cur = conn.execute("SELECT * FROM audit_log ORDER BY id;")
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+def _load_from_file(path: str) -> List[Dict]:
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8", newline="") as f:
+        if ext == ".csv":
+            return list(csv.DictReader(f))
+        if ext == ".json":
+            return json.load(f)
+        if ext == ".ndjson":
+            return [json.loads(line) for line in f if line.strip()]
+    raise ValueError(f"unsupported source: {path}")
+
+def load_events(sources: List[str]) -> List[Dict]:
+    rows = []
+    for src in sources:
+        rows.extend(_load_from_db(src) if src.endswith(".db") else _load_from_file(src))
+    events = []
+    for r in rows:
+        if r["action"] not in REPLAYED_ACTIONS:
+            continue
+        details = r["details_json"]
+        events.append({
+            "id": int(r["id"]),
+            "ts": datetime.strptime(r["ts"], "%Y-%m-%d %H:%M:%S"),
+            "action": r["action"],
+            "details": json.loads(details) if isinstance(details, str) else details,
+        })
+    events.sort(key=lambda e: e["id"])
+    return events
+
+# ---------- Execution ----------
+def _iso_to_ddmmyyyy(s: str) -> str:
+    try:
+        return datetime.strptime(s, "%Y-%m-%d %H:%M:%S").strftime("%d/%m/%Y")
+    except Exception:
+        return ""
+
+def run_event(service: Service, event: Dict) -> tuple:
+    """מריץ אירוע אחד דרך Service. מחזיר (תוצאה בפועל, תוצאה מקורית) להשוואה."""
+    action, d = event["action"], event["details"]
+    if action == "INTAKE":
+        service.intake(d["donor_id"], d["donor_name"], d["blood_type"], _iso_to_ddmmyyyy(d["donation_date"]))
+        return "ok", "ok"
+    if action == "PLAN_ROUTINE":
+        _, can_fulfill, missing = service.plan_routine_recommendation(d["recipient"], d["requested_qty"])
+        return (can_fulfill, missing), (d["can_fulfill"], d["missing"])
+    if action == "ISSUE_ROUTINE" or (action == "ISSUE_EMERGENCY" and "requested" not in d and "mode" in d):
+        # נרשם ע"י apply_plan — שורה לכל סוג תורם
+        taken = service.apply_plan([{"donor": d["donor_type"], "take": d["taken"]}], mode=d.get("mode", "routine"))
+        return taken, d["taken"]
+    if action == "ISSUE_EMERGENCY":
+        # "requested" קיים מאז ניפוק החירום החלקי; בלעדיו — ניפוק כל מלאי O-
+        taken = service.emergency_issue(d.get("requested"))
+        return taken, d["taken"]
+    raise ValueError(f"unknown action: {action}")
+
+def replay(events: List[Dict], scratch_path: str, workers: int = 1, speed: float = 0.0) -> Dict:
+    """speed=0: מהר ככל האפשר; speed=1: תזמון מקורי; speed=10: פי 10 מהמקור.
+    עם speed>0 ה-latency נמדד מהזמן המתוזמן של האירוע; עם speed=0 — מרגע הוצאתו מהתור."""
+    DB(scratch_path).close()  # יצירת סכמה לפני שה-workers מתחילים
+    q = queue.Queue(maxsize=workers * 4)
+    results = []
+    failures = []
+    abort = threading.Event()
+    lock = threading.Lock()
+
+    def worker():
+        db = None
+        try:
+            db = DB(scratch_path)
+            service = Service(db, actor="replay")
+            local = []
+            while not abort.is_set():
+                event = q.get()
+                if event is None:
+                    break
+                t0 = time.perf_counter()
+                try:
+                    actual, expected = run_event(service, event)
+                    error = None
+                except Exception as e:
+                    actual, expected, error = None, None, str(e)
+                t1 = time.perf_counter()
+                # latency נמדד מהזמן המתוזמן (ולא מהוצאה מהתור) — כולל המתנה בתור (coordinated omission)
+                scheduled = event["scheduled"] if event["scheduled"] is not None else t0
+                local.append({"id": event["id"], "action": event["action"],
+                              "latency_ms": (t1 - scheduled) * 1000.0,
+                              "service_ms": (t1 - t0) * 1000.0,
+                              "diverged": error is not None or actual != expected,
+                              "actual": actual, "expected": expected, "error": error})
+            with lock:
+                results.extend(local)
+        except Exception as e:
+            # כשל של worker (למשל חיבור ל-DB) עוצר את כל הריצה — לא ממשיכים עם פחות צרכנים
+            with lock:
+                failures.append(repr(e))
+            abort.set()
+        finally:
+            if db is not None:
+                db.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, workers))]
+    for t in threads:
+        t.start()
+
+    def put(item) -> bool:
+        # q.put עם timeout כדי שה-producer לא ייחסם לנצח אם ה-workers נפלו
+        while True:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if abort.is_set() or not any(t.is_alive() for t in threads):
+                    return False
+
+    start = time.perf_counter()
+    first_ts = events[0]["ts"] if events else None
+    max_lag = 0.0
+    for event in events:
+        if abort.is_set():
+            break
+        scheduled = None
+        if speed > 0:
+            scheduled = start + (event["ts"] - first_ts).total_seconds() / speed
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if not put(dict(event, scheduled=scheduled)):
+            break
+        if scheduled is not None:
+            # כמה מאחרי לוח הזמנים נכנס האירוע לתור (q.put חוסם כשה-workers לא עומדים בקצב)
+            max_lag = max(max_lag, time.perf_counter() - scheduled)
+    for _ in threads:
+        if not put(None):
+            break
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    if failures:
+        raise RuntimeError(f"replay aborted: {len(failures)} worker(s) failed: {failures[0]}")
+
+    report = summarize(results, elapsed, workers, speed)
+    report["max_dispatch_lag_ms"] = round(max_lag * 1000.0, 3)
+    return report
+
+# ---------- Reporting ----------
+def summarize(results: List[Dict], elapsed: float, workers: int, speed: float) -> Dict:
+    def stats(rows):
+        lat = [r["latency_ms"] for r in rows]
+        return {"count": len(rows),
+                "p50_ms": round(percentile(lat, 50), 3),
+                "p95_ms": round(percentile(lat, 95), 3),
+                "p99_ms": round(percentile(lat, 99), 3),
+                "max_ms": round(max(lat), 3) if lat else 0.0,
+                "service_p99_ms": round(percentile([r["service_ms"] for r in rows], 99), 3),
+                "diverged": sum(1 for r in rows if r["diverged"])}
+
+    results.sort(key=lambda r: r["id"])
+    return {
+        "workers": workers,
+        "speed": speed,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ops": round(len(results) / elapsed, 1) if elapsed > 0 else 0.0,
+        "overall": stats(results),
+        "by_action": {a: stats([r for r in results if r["action"] == a])
+                      for a in REPLAYED_ACTIONS if any(r["action"] == a for r in results)},
+        "divergences": [{k: r[k] for k in ("id", "action", "actual", "expected", "error")}
+                        for r in results if r["diverged"]],
+    }
+
+def print_report(report: Dict, max_divergences: int = 20):
+    print(f"workers={report['workers']} speed={report['speed'] or 'max'} "
+          f"elapsed={report['elapsed_s']}s throughput={report['throughput_ops']} ops/s "
+          f"max_dispatch_lag={report['max_dispatch_lag_ms']}ms")
+    print(f"{'action':<16}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'svc p99':>10}{'diverged':>10}")
+    rows = list(report["by_action"].items()) + [("TOTAL", report["overall"])]
+    for action, s in rows:
+        print(f"{action:<16}{s['count']:>8}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}"
+              f"{s['p99_ms']:>10.3f}{s['max_ms']:>10.3f}{s['service_p99_ms']:>10.3f}{s['diverged']:>10}")
+    for d in report["divergences"][:max_divergences]:
+        print(f"  diverged #{d['id']} {d['action']}: actual={d['actual']} expected={d['expected']}"
+              + (f" error={d['error']}" if d["error"] else ""))
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Replay BECS audit log against a scratch DB")
+    ap.add_argument("sources", nargs="+", help="blood_bank.db או audit_log.csv/.json/.ndjson")
+    ap.add_argument("--scratch", help="נתיב DB זמני (חייב לא להתקיים); ברירת מחדל: tempdir")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--speed", type=float, default=0.0, help="0=מהר ככל האפשר, 1=תזמון מקורי")
+    ap.add_argument("--json", dest="json_path", help="שמירת הדוח המלא כ-JSON")
+    args = ap.parse_args(argv)
+
+    events = load_events(args.sources)
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = args.scratch or os.path.join(tmp, "replay.db")
+        if os.path.exists(scratch):
+            print(f"scratch DB already exists: {scratch}", file=sys.stderr)
+            return 2
+        try:
+            report = replay(events, scratch, workers=args.workers, speed=args.speed)
+        except RuntimeError as e:
+            print(str(e), file=sys.stderr)
+            return 1
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,35 @@
 # file: service.py
 import re, json
+from functools import lru_cache
 from typing import Tuple, List, Dict
 from db import DB
 from constants import BLOOD_TYPES, COMPATIBILITY, POPULATION_PERCENT, parse_ddmmyyyy_or_iso, iso_now
 
+@lru_cache(maxsize=None)
+def _numpy():
+    """numpy אופציונלי (יש fallback בפייתון טהור); הייבוא נדחה לשימוש הראשון כדי לא להאט את העלייה."""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+# מטריצת תאימות קבועה: COMPAT_MATRIX[i][j] = 1 אם BLOOD_TYPES[i] יכול לתרום ל-BLOOD_TYPES[j]
+COMPAT_MATRIX = [[1 if r in COMPATIBILITY[d] else 0 for r in BLOOD_TYPES] for d in BLOOD_TYPES]
+
 class Service:
     def __init__(self, db: DB, actor: str = "operator"):
         self.db = db
         self.actor = actor  # אפשר בעתיד לחבר למסך לוגין
+        self._stock_version = 0      # עולה בכל שינוי מלאי דרך ה-Service
+        self._matrix_cache = None    # (key, result) של fulfillment_matrix
 
     @staticmethod
     def valid_id9(s: str) -> bool:
         return bool(re.fullmatch(r"\d{9}", (s or "").strip()))
 
-    def audit(self, action: str, entity: str, entity_id: str | None, details: dict):
-        self.db.add_audit(
+    def _audit_row(self, action: str, entity: str, entity_id: str | None, details: dict) -> dict:
+        return dict(
             ts=iso_now(),
             actor=self.actor,
             action=action,
@@ -23,6 +38,9 @@ class Service:
             details_json=json.dumps(details, ensure_ascii=False)
         )
 
+    def audit(self, action: str, entity: str, entity_id: str | None, details: dict):
+        self.db.add_audit(**self._audit_row(action, entity, entity_id, details))
+
     # ----- Intake -----
     def intake(self, donor_id: str, donor_name: str, blood_type: str, date_str: str):
         if blood_type not in BLOOD_TYPES:
@@ -31,6 +49,7 @@ class Service:
             raise ValueError('ת"ז חייבת להיות 9 ספרות')
         donation_iso = parse_ddmmyyyy_or_iso(date_str)
         new_id = self.db.add_donation(donor_id.strip(), donor_name.strip(), blood_type, donation_iso)
+        self._stock_version += 1
         # audit
         self.audit("INTAKE", "donations", str(new_id), {
             "donor_id": donor_id, "donor_name": donor_name,
@@ -76,6 +95,41 @@ class Service:
 
         return plan, can_fulfill, missing
 
+    # ----- What-if matrix (read-only, no audit) -----
+    def fulfillment_matrix(self) -> Dict[str, Dict]:
+        """לכל סוג מקבל: כמות מקסימלית שניתן לספק ותכנית הלקיחה, מצילום מלאי אחד.
+        התוצאה נשמרת עד לשינוי מלאי; לקריאה בלבד ואינה נרשמת ב-audit."""
+        key = (self._stock_version, self.db.data_version())
+        if self._matrix_cache is not None and self._matrix_cache[0] == key:
+            return self._matrix_cache[1]
+
+        stock = self.db.count_available_by_type()
+        avail = [stock[bt] for bt in BLOOD_TYPES]
+        np = _numpy()
+        if np is not None:
+            take = np.array(COMPAT_MATRIX, dtype=np.int64) * np.array(avail, dtype=np.int64)[:, None]
+            max_qty = take.sum(axis=0).tolist()
+            take = take.tolist()
+        else:
+            take = [[c * a for c in row] for row, a in zip(COMPAT_MATRIX, avail)]
+            max_qty = [sum(col) for col in zip(*take)]
+
+        recipients = {}
+        for j, recipient in enumerate(BLOOD_TYPES):
+            # אותו סדר כמו plan_routine_recommendation: הסוג המבוקש → זמינות גבוהה → פחות נדיר
+            alternatives = sorted(
+                (d for d in BLOOD_TYPES if recipient in COMPATIBILITY[d] and d != recipient),
+                key=lambda bt: (stock[bt], POPULATION_PERCENT.get(bt, 0)),
+                reverse=True
+            )
+            plan = [{"donor": d, "available": stock[d], "take": take[BLOOD_TYPES.index(d)][j]}
+                    for d in [recipient] + alternatives]
+            recipients[recipient] = {"max_qty": int(max_qty[j]), "plan": plan}
+
+        result = {"stock": stock, "recipients": recipients}
+        self._matrix_cache = (key, result)
+        return result
+
     # ----- Apply plan (execute) -----
     def apply_plan(self, plan: List[Dict], mode: str = "routine") -> int:
         total_issued = 0
@@ -87,6 +141,7 @@ class Service:
             ids = self.db.available_ids(donor, take)
             taken = self.db.mark_dispensed_ids(ids, mode=mode)
             if taken > 0:
+                self._stock_version += 1
                 self.db.log_dispensation(donor, taken, mode=mode)
                 total_issued += taken
                 # audit per donor-type taken
@@ -94,15 +149,21 @@ class Service:
                            "dispensations", None, {"donor_type": donor, "taken": taken, "mode": mode})
         return total_issued
 
-    # ----- Emergency O- all -----
-    def emergency_issue_all_on(self) -> int:
-        count = self.db.count_available('O-')
-        if count <= 0:
-            return 0
-        ids = self.db.available_ids('O-', count)
-        taken = self.db.mark_dispensed_ids(ids, mode="emergency")
+    # ----- Emergency O- (fast path) -----
+    def emergency_issue(self, quantity: int | None = None) -> int:
+        """ניפוק אר"ן: תופס quantity מנות O- (None = כל המלאי) בטרנזקציה אחת."""
+        if quantity is not None:
+            quantity = int(quantity)
+            if quantity <= 0:
+                raise ValueError("כמות מנות חייבת להיות מספר חיובי")
+        taken = self.db.issue_units(
+            'O-', quantity, mode="emergency",
+            audit_row=lambda taken: self._audit_row("ISSUE_EMERGENCY", "dispensations", None, {
+                "donor_type": "O-", "taken": taken, "requested": quantity, "mode": "emergency"
+            }))
         if taken > 0:
-            self.db.log_dispensation('O-', taken, mode="emergency")
-            # audit
-            self.audit("ISSUE_EMERGENCY", "dispensations", None, {"donor_type": "O-", "taken": taken})
+            self._stock_version += 1
         return taken
+
+    def emergency_issue_all_on(self) -> int:
+        return self.emergency_issue(None)